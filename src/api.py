@@ -0,0 +1,25 @@
+"""In-process access to the extractors, without writing anything to disk."""
+
+from rosbags.highlevel import AnyReader
+
+from src.extractors import EXTRACTORS, resolve_bag_files
+
+
+def iter_batches(bag_files, topic, extractor_type, batch_size=1000, args=None):
+    """Lazily yield batches of processed messages from a topic of one or more rosbags.
+
+    CSV-like types (imu, odometry, gnss, ...) yield pandas DataFrames with the same columns as the
+    extracted CSV files. Image and point cloud types yield dicts holding `timestamp` and `ros_time`
+    arrays along with a list of decoded images (`image`) or structured point arrays (`points`).
+    Audio yields int16 sample arrays and TF yields DataFrames with `base_frame` and
+    `target_frame` columns.
+    """
+    bag_files = resolve_bag_files(bag_files)
+    if extractor_type not in EXTRACTORS:
+        raise ValueError(f"Unsupported data type: {extractor_type}!")
+
+    extractor = EXTRACTORS[extractor_type](bag_files, topic, None, args or {})
+    with AnyReader(bag_files) as reader:
+        if topic not in {x.topic for x in reader.connections}:
+            raise ValueError(f"Topic {topic} not found in bag file.")
+        yield from extractor.iter_batches(reader, batch_size)
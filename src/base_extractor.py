@@ -1,23 +1,121 @@
+import queue
+import sqlite3
+import threading
 from abc import ABC, abstractmethod
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+from rosbags.highlevel import AnyReader
 from tqdm import tqdm
 
 
+class _Failure:
+    
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(item_queue, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(item_queue, stop_event):
+    while not stop_event.is_set():
+        try:
+            return item_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _extract_shard(extractor, index, start, stop):
+    """Extract the messages of one time shard in a worker process, with its own reader."""
+    extractor._prepare_shard(index)
+    with AnyReader(extractor.bag_files) as reader:
+        connections = [x for x in reader.connections if x.topic == extractor.topic_name]
+        data = extractor._read_messages(reader, connections, None, start, stop, position=index)
+    extractor._finish_shard(index)
+    return data
+
+
+def _indexed_timestamps(connections):
+    """Sorted bag timestamps of the messages of connections, read from the bag indexes without the payloads.
+    
+    Uses the chunk indexes of ROS1 bags and the messages table of ROS2 sqlite3 bags. Returns None when
+    a connection comes from a bag without such an index (e.g. mcap).
+    """
+    timestamps = []
+    for connection in connections:
+        owner = getattr(connection, "owner", None)
+        if hasattr(owner, "indexes"):
+            timestamps.extend(x.time for x in owner.indexes[connection.id])
+        elif getattr(owner, "metadata", {}).get("storage_identifier") == "sqlite3":
+            for path in owner.paths:
+                with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as database:
+                    rows = database.execute(
+                        "SELECT messages.timestamp FROM messages JOIN topics ON messages.topic_id = topics.id "
+                        "WHERE topics.name = ?", [connection.topic])
+                    timestamps.extend(x for (x,) in rows)
+        else:
+            return None
+    return np.sort(np.array(timestamps, dtype=np.int64))
+
+
+def _time_range(reader, connections):
+    """First and last bag timestamps of connections, bisecting on the start time so that only a few messages are read."""
+    first = next(reader.messages(connections=connections), None)
+    if first is None:
+        return None
+    low, high = first[1], reader.end_time
+    while low < high:
+        middle = (low + high + 1) // 2
+        if next(reader.messages(connections=connections, start=middle), None) is None:
+            high = middle - 1
+        else:
+            low = middle
+    return first[1], low
+
+
 class BaseExtractor(ABC):
     
-    def __init__(self, bag_file, topic_name, save_folder, args, overwrite=False):
-        self.bag_file = Path(bag_file)
+    # Whether messages can be processed concurrently (False for extractors keeping state between messages)
+    parallel_safe = True
+    # Whether the time range can be split between processes (False if a message depends on all previous ones)
+    shardable = True
+    # Whether memory use stays bounded whatever the number of messages (False when rows are kept until saving)
+    bounded_memory = False
+    # Whether the extractor can follow a bag that is still being recorded
+    live = True
+    # Topics read besides the extracted one, which are also followed in a bag being recorded
+    auxiliary_topics = []
+    
+    def __init__(self, bag_files, topic_name, save_folder, args, overwrite=False):
+        if isinstance(bag_files, (str, Path)):
+            bag_files = [bag_files]
+        self.bag_files = [Path(x) for x in bag_files]
         self.topic_name = topic_name
-        self.save_folder = Path(save_folder)
-        self.args = args
+        self.save_folder = Path(save_folder) if save_folder is not None else None
+        self.args = args or {}
         self.overwrite = overwrite
         self.message_count = 0
+        self.workers = self.args.get("workers", 0)
+        self.queue_size = self.args.get("queue_size", 64)
+        self.shards = self.args.get("shards", 1)
+        self._stream_data = []
         
     def extract(self, reader):
         if not self._check_overwrite():
             return
         
+        self._prepare(reader)
         self._pre_extract(reader)
         
         connections = [x for x in reader.connections if x.topic == self.topic_name]
@@ -28,17 +126,179 @@ class BaseExtractor(ABC):
         message_count = sum(getattr(connection, "msgcount", 0) for connection in connections)
         self._log_start()
         
+        if self.shards > 1 and self.shardable:
+            data = self._read_messages_sharded(reader, connections, message_count)
+        else:
+            if self.shards > 1:
+                print(f"Warning: {self.data_type} extraction cannot be sharded, using a single process")
+            data = self._read_messages(reader, connections, message_count)
+        self._save_data(data)
+        self._log_complete()
+        self._post_extract(reader)
+    
+    def _read_messages(self, reader, connections, message_count, start=None, stop=None, position=None):
+        if self.workers > 0:
+            return self._read_messages_pipelined(reader, connections, message_count, start, stop, position)
+        
+        messages = reader.messages(connections=connections, start=start, stop=stop)
         data = []
-        for connection, ros_time, rawdata in tqdm(reader.messages(connections=connections), total=message_count):
+        for connection, ros_time, rawdata in tqdm(messages, total=message_count, position=position):
             msg = reader.deserialize(rawdata, connection.msgtype)
             row_data = self._process_message(msg, ros_time, connection.msgtype)
             if row_data is not None:
                 data.append(row_data)
+        return data
+    
+    def _read_messages_sharded(self, reader, connections, message_count):
+        """Split the time range of the topic in shards extracted in parallel by worker processes.
         
-        self._save_data(data)
+        When the bag indexes give the timestamps of the topic, each shard holds about the same number
+        of messages. Otherwise the range between the first and last messages of the topic is split in
+        equal durations. Each worker opens its own reader and returns its rows, which are concatenated
+        in time order. Files written per message go directly to the shared output folder.
+        """
+        timestamps = _indexed_timestamps(connections)
+        if timestamps is not None:
+            if len(timestamps) == 0:
+                return []
+            bounds = [int(timestamps[len(timestamps) * i // self.shards]) for i in range(self.shards)]
+            bounds.append(int(timestamps[-1]) + 1)
+            print(f"Extracting in {self.shards} time shards of about {len(timestamps) // self.shards} messages")
+        else:
+            time_range = _time_range(reader, connections)
+            if time_range is None:
+                return []
+            start, stop = time_range[0], time_range[1] + 1
+            bounds = [start + (stop - start) * i // self.shards for i in range(self.shards + 1)]
+            print(f"Extracting in {self.shards} time shards of {(stop - start) / self.shards / 1e9:.1f} s")
+        
+        with ProcessPoolExecutor(max_workers=self.shards) as pool:
+            futures = [pool.submit(_extract_shard, self, i, bounds[i], bounds[i + 1]) for i in range(self.shards)]
+            results = [future.result() for future in futures]
+        
+        self._merge_shards(self.shards)
+        return [row for shard in results for row in shard]
+    
+    def _read_messages_pipelined(self, reader, connections, message_count, start=None, stop=None, position=None):
+        """Read, process and collect messages in separate threads connected by bounded queues.
+        
+        Messages are read on this thread, since readers cannot always be used from another thread
+        (sqlite3 connections of rosbags < 0.11). Reading stops once `queue_size` messages are in
+        flight, workers deserialize and process messages concurrently, and a collector thread puts
+        the results back in bag order. The first exception raised stops the pipeline and is re-raised.
+        """
+        n_workers = self.workers if self.parallel_safe else 1
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        in_flight = threading.Semaphore(self.queue_size)
+        stop_event = threading.Event()
+        data, failures = [], []
+        
+        def process():
+            while (item := _get(raw_queue, stop_event)) is not None:
+                index, connection, ros_time, rawdata = item
+                try:
+                    msg = reader.deserialize(rawdata, connection.msgtype)
+                    result = self._process_message(msg, ros_time, connection.msgtype)
+                except Exception as error:
+                    result = _Failure(error)
+                if not _put(result_queue, (index, result), stop_event):
+                    return
+            _put(result_queue, None, stop_event)
+        
+        def collect():
+            pending, next_index, running = {}, 0, n_workers
+            with tqdm(total=message_count, position=position) as progress:
+                while running:
+                    item = _get(result_queue, stop_event)
+                    if item is None:
+                        if stop_event.is_set():
+                            return
+                        running -= 1
+                        continue
+                    
+                    index, result = item
+                    if isinstance(result, _Failure):
+                        failures.append(result.error)
+                        stop_event.set()
+                        return
+                    pending[index] = result
+                    
+                    while next_index in pending:
+                        result = pending.pop(next_index)
+                        in_flight.release()
+                        if result is not None:
+                            data.append(result)
+                        next_index += 1
+                        progress.update(1)
+        
+        collector = threading.Thread(target=collect, daemon=True)
+        threads = [threading.Thread(target=process, daemon=True) for _ in range(n_workers)] + [collector]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            for index, item in enumerate(reader.messages(connections=connections, start=start, stop=stop)):
+                while not in_flight.acquire(timeout=0.1):
+                    if stop_event.is_set():
+                        break
+                if stop_event.is_set() or not _put(raw_queue, (index, *item), stop_event):
+                    break
+            for _ in range(n_workers):
+                _put(raw_queue, None, stop_event)
+            collector.join()
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        
+        if failures:
+            raise failures[0]
+        return data
+    
+    def iter_batches(self, reader, batch_size=1000):
+        """Yield processed messages in batches without writing anything to disk."""
+        self._prepare(reader)
+        
+        connections = [x for x in reader.connections if x.topic == self.topic_name]
+        batch = []
+        for connection, ros_time, rawdata in reader.messages(connections=connections):
+            msg = reader.deserialize(rawdata, connection.msgtype)
+            item = self._load_message(msg, ros_time, connection.msgtype)
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= batch_size:
+                yield self._make_batch(batch)
+                batch = []
+        
+        if batch:
+            yield self._make_batch(batch)
+    
+    def _prepare(self, reader):
+        pass
+    
+    def _append_data(self, data):
+        """Handle data processed while following a bag being recorded (kept until the end by default)."""
+        self._stream_data.extend(data)
+    
+    def _process_auxiliary_message(self, msg, ros_time, msgtype):
+        """Handle a message of an auxiliary topic written while following a bag being recorded."""
+        pass
+    
+    def _finish_stream(self, reader):
+        self._save_data(self._stream_data)
         self._log_complete()
         self._post_extract(reader)
     
+    def _prepare_shard(self, index):
+        pass
+    
+    def _finish_shard(self, index):
+        pass
+    
+    def _merge_shards(self, shard_count):
+        pass
+    
     def _pre_extract(self, reader):
         pass
     
@@ -53,6 +313,12 @@ class BaseExtractor(ABC):
     def _process_message(self, msg, ros_time, msgtype):
         pass
     
+    def _load_message(self, msg, ros_time, msgtype):
+        return self._process_message(msg, ros_time, msgtype)
+    
+    def _make_batch(self, items):
+        return pd.DataFrame(items)
+    
     @abstractmethod
     def _save_data(self, data):
         pass
@@ -68,9 +334,13 @@ class BaseExtractor(ABC):
 
 class CSVExtractor(BaseExtractor):
     
-    def __init__(self, bag_file, topic_name, save_folder, args, overwrite=False):
-        super().__init__(bag_file, topic_name, save_folder, args, overwrite)
-        self.output_file = self.save_folder / (self.save_folder.name + ".csv")
+    # Whether rows can be appended to the output file while following a bag being recorded
+    streamable = True
+    
+    def __init__(self, bag_files, topic_name, save_folder, args, overwrite=False):
+        super().__init__(bag_files, topic_name, save_folder, args, overwrite)
+        self.output_file = self.save_folder / (self.save_folder.name + ".csv") if self.save_folder else None
+        self._streamed = False
     
     def _check_overwrite(self):
         if not self.overwrite and self.output_file.exists():
@@ -79,8 +349,34 @@ class CSVExtractor(BaseExtractor):
         return True
     
     def _save_data(self, data):
-        df = pd.DataFrame(data)
+        df = self._make_batch(data)
         df.to_csv(self.output_file, index=False)
+        self._finalize_output()
+    
+    def _append_data(self, data):
+        if not self.streamable:
+            super()._append_data(data)
+            return
+        if not data:
+            return
+        df = self._make_batch(data)
+        df.to_csv(self.output_file, mode="a" if self._streamed else "w", header=not self._streamed, index=False)
+        self._streamed = True
+    
+    def _finish_stream(self, reader):
+        if not self.streamable:
+            super()._finish_stream(reader)
+            return
+        if self._streamed:
+            self._finalize_output()
+        else:
+            self._save_data([])
+        self._log_complete()
+        self._post_extract(reader)
+    
+    def _finalize_output(self):
+        """Write the files accompanying the output file, once all its rows are written."""
+        pass
     
     def _log_start(self):
         print(f"Extracting {self.data_type} data from topic \"{self.topic_name}\" to file \"{self.output_file.name}\"")
@@ -91,6 +387,15 @@ class CSVExtractor(BaseExtractor):
 
 class FolderExtractor(BaseExtractor):
     
+    bounded_memory = True
+    
+    def _make_batch(self, items):
+        batch = {key: [item[key] for item in items] for key in items[0]}
+        for key in ("timestamp", "ros_time"):
+            if key in batch:
+                batch[key] = np.array(batch[key], dtype=np.int64)
+        return batch
+    
     def _check_overwrite(self):
         if not self.overwrite and self.save_folder.exists() and any(self.save_folder.iterdir()):
             print(f"Output folder {self.save_folder} already exists and not empty. Skipping...")
@@ -101,6 +406,9 @@ class FolderExtractor(BaseExtractor):
     def _save_data(self, data):
         pass
     
+    def _append_data(self, data):
+        pass
+    
     def _log_start(self):
         print(f"Extracting {self.data_type} data from topic \"{self.topic_name}\" to folder \"{self.save_folder}\"")
     
@@ -0,0 +1,76 @@
+"""Registry of the extractors available in config files, by data type, and helpers to select their inputs."""
+
+from pathlib import Path
+
+from src.types.audio import AudioExtractor
+from src.types.bag import BagExtractor
+from src.types.basic import BasicExtractor
+from src.types.gnss import GNSSExtractor
+from src.types.image import ImageExtractor
+from src.types.imu import IMUExtractor
+from src.types.odom import OdometryExtractor
+from src.types.pose import PoseExtractor
+from src.types.point_cloud import PointCloudExtractor
+from src.types.sync import SyncExtractor
+from src.types.tf import TFExtractor
+from src.types.twist import TwistExtractor
+from src.utils import Colors
+
+
+EXTRACTORS = {
+    "pose": PoseExtractor,
+    "twist": TwistExtractor,
+    "imu": IMUExtractor,
+    "odometry": OdometryExtractor,
+    "gnss": GNSSExtractor,
+    "point_cloud": PointCloudExtractor,
+    "image": ImageExtractor,
+    "basic": BasicExtractor,
+    "audio": AudioExtractor,
+    "tf": TFExtractor,
+    "sync": SyncExtractor,
+    "bag": BagExtractor,
+}
+
+
+def check_requested_topics(reader, config, ignore_missing=False):
+    bag_topics = {x.topic for x in reader.connections}
+
+    to_remove = []
+    for i, data in enumerate(config):
+        topic_names = data["topic"] if isinstance(data["topic"], list) else [data["topic"]]
+        for topic_name in topic_names:
+            if topic_name not in bag_topics:
+                if ignore_missing:
+                    print(f"{Colors.WARNING}Warning: Topic {topic_name} not found in bag file. Ignoring...{Colors.ENDC}")
+                else:
+                    raise ValueError(f"Topic {topic_name} not found in bag file.")
+
+        found = [x for x in topic_names if x in bag_topics]
+        if not found:
+            to_remove.append(i)
+        elif isinstance(data["topic"], list):
+            data["topic"] = found
+
+    for i in reversed(to_remove):
+        config.pop(i)
+
+
+def resolve_bag_files(inputs):
+    if isinstance(inputs, (str, Path)):
+        inputs = [inputs]
+
+    bag_files = []
+    for path in map(Path, inputs):
+        if not path.exists():
+            raise FileNotFoundError(f"Bag file {path} not found.")
+        if path.is_file() or (path / "metadata.yaml").exists():
+            bag_files.append(path)
+            continue
+
+        split_bags = sorted(x for x in path.iterdir() if x.suffix == ".bag" or (x / "metadata.yaml").exists())
+        if not split_bags:
+            raise FileNotFoundError(f"No bag files found in directory {path}.")
+        bag_files.extend(split_bags)
+
+    return bag_files
@@ -0,0 +1,316 @@
+"""Incremental extraction of a ROS2 (sqlite3) bag that is still being recorded."""
+
+import argparse
+import re
+import sqlite3
+import time
+import yaml
+from dataclasses import dataclass
+from pathlib import Path
+from rosbags.typesys import get_types_from_msg, get_typestore, Stores
+
+from src.extractors import EXTRACTORS, check_requested_topics
+from src.utils import Colors
+
+# rosbag2 writes metadata.yaml when the recording stops, wait this long for late rows before stopping
+FINISH_GRACE = 5.0
+# Topics are added to the bag as the recorder discovers them, wait this long for the requested ones
+TOPIC_DISCOVERY_TIMEOUT = 10.0
+DEFINITION_SEPARATOR = re.compile(r"^=+\n", re.MULTILINE)
+
+
+@dataclass(eq=False)
+class LiveConnection:
+    id: int
+    topic: str
+    msgtype: str
+    msgcount: int = 0
+
+
+def split_index(db_path):
+    match = re.search(r"_(\d+)$", db_path.stem)
+    return int(match.group(1)) if match else 0
+
+
+class LiveReader:
+    """Minimal reader over the sqlite3 files of a ROS2 bag being recorded.
+
+    `messages` reads the snapshot taken by the last `refresh`, like a finished bag, while `poll`
+    returns only the messages written since the previous poll. New split files and topics are
+    picked up on each refresh.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.typestore = get_typestore(Stores.LATEST)
+        self.connections = []
+        self._topics = {}  # {topic name: LiveConnection}
+        self._topic_ids = {}  # {(db path, topic id): LiveConnection}
+        self._databases = {}  # {db path: sqlite3 connection}
+        self._snapshot = {}  # {db path: last message id of the snapshot}
+        self._cursor = {}  # {db path: last message id returned by poll}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for database in self._databases.values():
+            database.close()
+        self._databases.clear()
+
+    def refresh(self):
+        for db_path in sorted(self.path.glob("*.db3"), key=split_index):
+            if db_path not in self._databases:
+                self._databases[db_path] = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+                self._cursor[db_path] = 0
+            database = self._databases[db_path]
+
+            try:
+                topics = database.execute("SELECT id, name, type FROM topics").fetchall()
+                last_id = database.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+            except sqlite3.OperationalError:
+                continue  # Tables not created yet
+
+            for topic_id, name, msgtype in topics:
+                if (db_path, topic_id) not in self._topic_ids:
+                    if name not in self._topics:
+                        self._topics[name] = LiveConnection(len(self.connections) + 1, name, msgtype)
+                        self.connections.append(self._topics[name])
+                        self._register_type(database, msgtype)
+                    self._topic_ids[(db_path, topic_id)] = self._topics[name]
+            self._snapshot[db_path] = last_id
+
+    def messages(self, connections=None, start=None, stop=None):
+        for db_path, last_id in list(self._snapshot.items()):
+            yield from self._query(db_path, 0, last_id, connections, start, stop)
+
+    def poll(self, connections=None):
+        """Refresh and return the messages of connections written since the previous poll."""
+        self.refresh()
+        rows = []
+        for db_path, last_id in self._snapshot.items():
+            rows.extend(self._query(db_path, self._cursor[db_path], last_id, connections))
+            self._cursor[db_path] = last_id
+        return rows
+
+    def deserialize(self, rawdata, msgtype):
+        return self.typestore.deserialize_cdr(rawdata, msgtype)
+
+    def _query(self, db_path, after_id, last_id, connections=None, start=None, stop=None):
+        query = "SELECT topic_id, timestamp, data FROM messages WHERE id > ? AND id <= ?"
+        params = [after_id, last_id]
+        if connections is not None:
+            topic_ids = [topic_id for (path, topic_id), x in self._topic_ids.items() if path == db_path and x in connections]
+            if not topic_ids:
+                return
+            query += f" AND topic_id IN ({','.join('?' * len(topic_ids))})"
+            params += topic_ids
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start)
+        if stop is not None:
+            query += " AND timestamp < ?"
+            params.append(stop)
+
+        for topic_id, timestamp, data in self._databases[db_path].execute(query + " ORDER BY timestamp", params):
+            connection = self._topic_ids.get((db_path, topic_id))
+            if connection is not None:
+                yield connection, timestamp, data
+
+    def _register_type(self, database, msgtype):
+        """Register message definitions stored in the bag (rosbag2 Iron and later), for custom types."""
+        try:
+            row = database.execute(
+                "SELECT encoded_message_definition FROM message_definitions WHERE topic_type = ? AND encoding = 'ros2msg'",
+                [msgtype]).fetchone()
+        except sqlite3.OperationalError:
+            return
+        if not row or not row[0]:
+            return
+
+        name, types = msgtype, {}
+        for block in DEFINITION_SEPARATOR.split(row[0]):
+            if block.startswith("MSG: "):
+                header, _, block = block.partition("\n")
+                name = header[len("MSG: "):].strip()
+                if "/msg/" not in name:
+                    name = name.replace("/", "/msg/", 1)
+            types.update(get_types_from_msg(block, name))
+        try:
+            self.typestore.register(types)
+        except Exception:
+            pass  # Already known with a different definition, keep the default one
+
+
+def follow_bag(bag_dir, config, output_folder, overwrite=False, ignore_missing=False, poll_interval=1.0,
+               idle_timeout=None):
+    """Extract a ROS2 sqlite3 bag while it is being recorded, appending to the outputs every poll_interval.
+
+    Stops once the recording is finished (metadata.yaml written and no new messages), after
+    idle_timeout seconds without new messages, or on Ctrl+C.
+    """
+    bag_dir = Path(bag_dir)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    print(f"Waiting for recording in {bag_dir}...")
+    while not any(bag_dir.glob("*.db3")):
+        if any(bag_dir.glob("*.mcap")):
+            raise ValueError("Following a bag is only supported with the sqlite3 storage.")
+        time.sleep(poll_interval)
+
+    with LiveReader(bag_dir) as reader:
+        requested = {x for data in config for x in (data["topic"] if isinstance(data["topic"], list) else [data["topic"]])}
+        # Also wait for the auxiliary topics (e.g. /tf_static), which may be registered after the first refresh
+        awaited = requested | {x for data in config if data["type"] in EXTRACTORS
+                               for x in EXTRACTORS[data["type"]].auxiliary_topics}
+        deadline = time.monotonic() + TOPIC_DISCOVERY_TIMEOUT
+        reader.refresh()
+        while not awaited <= {x.topic for x in reader.connections} and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            reader.refresh()
+        check_requested_topics(reader, config, ignore_missing)
+
+        extractors = []
+        for data in config:
+            if data["type"] not in EXTRACTORS:
+                raise ValueError(f"{Colors.FAIL}Unsupported data type: {data['type']}!{Colors.ENDC}")
+
+            save_folder = output_folder / data["folder"]
+            save_folder.mkdir(parents=True, exist_ok=True)
+            extractor = EXTRACTORS[data["type"]](bag_dir, data["topic"], save_folder, data.get("args", {}), overwrite)
+            if not extractor.live:
+                print(f"{Colors.WARNING}Warning: {data['type']} data cannot be extracted live. Ignoring...{Colors.ENDC}")
+                continue
+            if not extractor._check_overwrite():
+                continue
+
+            extractor._prepare(reader)
+            extractor._pre_extract(reader)
+            extractor._log_start()
+            extractors.append(extractor)
+
+        last_activity = time.monotonic()
+        try:
+            while True:
+                finished = (bag_dir / "metadata.yaml").exists()
+                topics = {x for extractor in extractors for x in [extractor.topic_name, *extractor.auxiliary_topics]}
+                rows = reader.poll([x for x in reader.connections if x.topic in topics])
+                if rows:
+                    feed_extractors(reader, extractors, rows)
+                    last_activity = time.monotonic()
+                    print(f"\r{len(rows)} new messages at {time.strftime('%H:%M:%S')}", end="", flush=True)
+
+                idle = time.monotonic() - last_activity
+                if (finished and idle > FINISH_GRACE) or (idle_timeout is not None and idle > idle_timeout):
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("\nInterrupted, saving remaining data...")
+        finally:
+            print()
+            for extractor in extractors:
+                extractor._finish_stream(reader)
+
+
+def feed_extractors(reader, extractors, rows):
+    rows_by_topic = {}
+    for row in rows:
+        rows_by_topic.setdefault(row[0].topic, []).append(row)
+
+    for extractor in extractors:
+        for topic in extractor.auxiliary_topics:
+            for connection, ros_time, rawdata in rows_by_topic.get(topic, []):
+                msg = reader.deserialize(rawdata, connection.msgtype)
+                extractor._process_auxiliary_message(msg, ros_time, connection.msgtype)
+
+        data = []
+        for connection, ros_time, rawdata in rows_by_topic.get(extractor.topic_name, []):
+            msg = reader.deserialize(rawdata, connection.msgtype)
+            row_data = extractor._process_message(msg, ros_time, connection.msgtype)
+            if row_data is not None:
+                data.append(row_data)
+        extractor._append_data(data)
+
+
+def replay_bag(source, destination, rate=1.0, commit_interval=0.1):
+    """Copy a finished ROS2 sqlite3 bag into a new one at the recording pace, to test following locally."""
+    source, destination = Path(source), Path(destination)
+    destination.mkdir(parents=True, exist_ok=False)
+    output = sqlite3.connect(destination / f"{destination.name}_0.db3")
+    output.executescript("""
+        CREATE TABLE topics(id INTEGER PRIMARY KEY, name TEXT NOT NULL, type TEXT NOT NULL,
+                            serialization_format TEXT NOT NULL, offered_qos_profiles TEXT NOT NULL);
+        CREATE TABLE messages(id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, timestamp INTEGER NOT NULL,
+                              data BLOB NOT NULL);
+    """)
+    output.commit()
+
+    topic_ids = {}
+    first_stamp, start, last_commit = None, time.monotonic(), time.monotonic()
+    for db_path in sorted(source.glob("*.db3"), key=split_index):
+        database = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        topics = {}
+        for topic_id, name, msgtype, serialization, qos in database.execute(
+                "SELECT id, name, type, serialization_format, offered_qos_profiles FROM topics"):
+            if name not in topic_ids:
+                topic_ids[name] = len(topic_ids) + 1
+                output.execute("INSERT INTO topics VALUES (?, ?, ?, ?, ?)",
+                               (topic_ids[name], name, msgtype, serialization, qos))
+            topics[topic_id] = topic_ids[name]
+
+        for topic_id, timestamp, data in database.execute(
+                "SELECT topic_id, timestamp, data FROM messages ORDER BY timestamp"):
+            first_stamp = timestamp if first_stamp is None else first_stamp
+            delay = start + (timestamp - first_stamp) / 1e9 / rate - time.monotonic()
+            if delay > 0:
+                output.commit()
+                time.sleep(delay)
+            output.execute("INSERT INTO messages (topic_id, timestamp, data) VALUES (?, ?, ?)",
+                           (topics[topic_id], timestamp, data))
+            if time.monotonic() - last_commit > commit_interval:
+                output.commit()
+                last_commit = time.monotonic()
+        database.close()
+
+    output.commit()
+    output.close()
+    write_metadata(source, destination)
+
+
+def write_metadata(source, destination):
+    """Write the metadata.yaml of a replayed bag, which marks the end of the recording."""
+    if not (source / "metadata.yaml").exists():
+        (destination / "metadata.yaml").touch()
+        return
+
+    with open(source / "metadata.yaml") as metadata_file:
+        metadata = yaml.safe_load(metadata_file)
+    info = metadata["rosbag2_bagfile_information"]
+    file_name = f"{destination.name}_0.db3"
+    info["relative_file_paths"] = [file_name]
+    if info.get("files"):
+        info["files"] = [{
+            "path": file_name,
+            "starting_time": info["files"][0]["starting_time"],
+            "duration": info["duration"],
+            "message_count": info["message_count"],
+        }]
+    with open(destination / "metadata.yaml", "w") as metadata_file:
+        yaml.safe_dump(metadata, metadata_file, sort_keys=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a ROS2 sqlite3 bag into a growing bag, to test --follow.")
+    parser.add_argument("source", type=str, help="Path to the recorded ROS2 sqlite3 bag.")
+    parser.add_argument("destination", type=str, help="Path of the new bag, written at the recording pace.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Replay speed factor.")
+    args = parser.parse_args()
+    replay_bag(args.source, args.destination, args.rate)
+
+
+if __name__ == "__main__":
+    main()
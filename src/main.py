@@ -8,30 +8,7 @@ from pathlib import Path
 from rosbags.highlevel import AnyReader
 
 from src.utils import Colors
-from src.types.audio import AudioExtractor
-from src.types.basic import BasicExtractor
-from src.types.gnss import GNSSExtractor
-from src.types.image import ImageExtractor
-from src.types.imu import IMUExtractor
-from src.types.odom import OdometryExtractor
-from src.types.pose import PoseExtractor
-from src.types.point_cloud import PointCloudExtractor
-from src.types.tf import TFExtractor
-from src.types.twist import TwistExtractor
-
-
-EXTRACTORS = {
-    "pose": PoseExtractor,
-    "twist": TwistExtractor,
-    "imu": IMUExtractor,
-    "odometry": OdometryExtractor,
-    "gnss": GNSSExtractor,
-    "point_cloud": PointCloudExtractor,
-    "image": ImageExtractor,
-    "basic": BasicExtractor,
-    "audio": AudioExtractor,
-    "tf": TFExtractor,
-}
+from src.extractors import EXTRACTORS, check_requested_topics, resolve_bag_files
 
 
 def load_config(name) -> dict:
@@ -43,41 +20,38 @@ def load_config(name) -> dict:
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Extract data from a rosbag file to a directory.")
-    parser.add_argument("-i", "--input", type=str, help="Path to the ROS1 or ROS2 bag.", required=True)
+    parser.add_argument("-i", "--input", type=str, nargs="+", required=True,
+                        help="Path(s) to the ROS1 or ROS2 bag(s), or to a directory of split bags.")
     parser.add_argument("-c", "--config", type=str, help="Configuration file name (see configs folder)", required=True)
-    parser.add_argument("-o", "--output", type=str, help="Output directory.", required=True)
+    parser.add_argument("-o", "--output", type=str, help="Output directory (not needed with --plan).")
     parser.add_argument("--ignore-missing", action="store_true", help="Ignore missing topics in the config file.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing files in the output directory.")
     parser.add_argument("--silent", action="store_true", help="Silent mode - suppress all output to terminal.")
-    return parser.parse_args()
-
-
-def check_requested_topics(reader, config, ignore_missing=False):
-    bag_topics = {x.topic for x in reader.connections}
-
-    to_remove = []
-    for i, data in enumerate(config):
-        topic_name = data["topic"]
-        if topic_name not in bag_topics:
-            if ignore_missing:
-                print(f"{Colors.WARNING}Warning: Topic {topic_name} not found in bag file. Ignoring...{Colors.ENDC}")
-                to_remove.append(i)
-            else:
-                raise ValueError(f"Topic {topic_name} not found in bag file.")
-
-    for i in reversed(to_remove):
-        config.pop(i)
-
-
-def extract_data(bag_file, config, output_folder, overwrite=False, ignore_missing=False):
-    bag_file = Path(bag_file)
-    if not bag_file.exists():
-        raise FileNotFoundError(f"Bag file {bag_file} not found.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Estimate runtime, output size and memory of each config entry without extracting.")
+    parser.add_argument("--sample-size", type=int, default=20, help="Number of messages sampled per entry by --plan.")
+    parser.add_argument("--follow", action="store_true",
+                        help="Extract a ROS2 sqlite3 bag while it is being recorded, appending to the outputs.")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between checks for new messages.")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="Stop following after this many seconds without new messages.")
+    args = parser.parse_args()
+    if not args.plan and not args.output:
+        parser.error("the following arguments are required: -o/--output")
+    if args.follow and len(args.input) != 1:
+        parser.error("--follow takes a single bag directory")
+    return args
+
+
+def extract_data(bag_files, config, output_folder, overwrite=False, ignore_missing=False):
+    bag_files = resolve_bag_files(bag_files)
+    if len(bag_files) > 1:
+        print(f"Merging {len(bag_files)} bags into a single timeline")
     
     output_folder = Path(output_folder)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    with AnyReader([bag_file]) as reader:
+    with AnyReader(bag_files) as reader:
         check_requested_topics(reader, config, ignore_missing)
         
         for data in config:
@@ -91,7 +65,7 @@ def extract_data(bag_file, config, output_folder, overwrite=False, ignore_missin
 
             if extractor_type in EXTRACTORS:
                 extractor = EXTRACTORS[extractor_type](
-                    bag_file, data["topic"], save_folder, args, overwrite
+                    bag_files, data["topic"], save_folder, args, overwrite
                 )
                 extractor.extract(reader)
             else:
@@ -108,6 +82,17 @@ def main():
         sys.stdout = open(os.devnull, 'w')
         sys.stderr = open(os.devnull, 'w')
     
+    if args.plan:
+        from src.planner import plan_extraction
+        plan_extraction(args.input, config, ignore_missing=args.ignore_missing, sample_size=args.sample_size)
+        return
+    
+    if args.follow:
+        from src.follow import follow_bag
+        follow_bag(args.input[0], config, args.output, overwrite=args.overwrite, ignore_missing=args.ignore_missing,
+                   poll_interval=args.poll_interval, idle_timeout=args.idle_timeout)
+        return
+    
     extract_data(args.input, config, args.output, overwrite=args.overwrite, ignore_missing=args.ignore_missing)
 
 
@@ -0,0 +1,172 @@
+"""Estimation of the cost of an extraction from the bag metadata and a small sample of messages."""
+
+import contextlib
+import io
+import itertools
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from rosbags.highlevel import AnyReader
+
+from src.extractors import EXTRACTORS, check_requested_topics, resolve_bag_files
+from src.utils import Colors
+
+DOMINANT_SHARE = 0.5
+
+
+@dataclass
+class EntryEstimate:
+    folder: str
+    data_type: str
+    message_count: int
+    sampled: int
+    read_bytes: float
+    runtime: float
+    output_bytes: float
+    peak_memory: float
+
+
+class SampleReader:
+    """Reader view yielding at most `sample_size` messages per call to `messages`."""
+
+    def __init__(self, reader, sample_size):
+        self._reader = reader
+        self._sample_size = sample_size
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+    def messages(self, *args, **kwargs):
+        return itertools.islice(self._reader.messages(*args, **kwargs), self._sample_size)
+
+
+def folder_size(path):
+    return sum(x.stat().st_size for x in Path(path).rglob("*") if x.is_file())
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{int(hours):d}:{int(minutes):02d}:{seconds:04.1f}"
+
+
+def extrapolate(small, full, small_count, full_count, total_count):
+    """Extrapolate a cost measured on two sample sizes to all messages, counting one-time costs once.
+
+    The difference between the two samples gives the cost per message, which excludes the setup
+    (calibration, static transforms, output files) paid by every run.
+    """
+    if full_count >= total_count:
+        return full
+    if full_count <= small_count:
+        return full * total_count / full_count
+    per_message = max((full - small) / (full_count - small_count), 0.0)
+    return full + per_message * (total_count - full_count)
+
+
+def run_sample(reader, bag_files, data, save_folder, sample_size, trace_memory=False):
+    """Run the extractor of a config entry on a sample of messages, with its output in save_folder."""
+    args = dict(data.get("args") or {}, workers=0, shards=1)
+    save_folder.mkdir(parents=True, exist_ok=True)
+    extractor = EXTRACTORS[data["type"]](bag_files, data["topic"], save_folder, args, overwrite=True)
+    sample_reader = SampleReader(reader, sample_size)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        extractor.extract(sample_reader)
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return extractor, elapsed, peak
+
+
+def estimate_entry(reader, bag_files, data, work_folder, sample_size):
+    topics = data["topic"] if isinstance(data["topic"], list) else [data["topic"]]
+    connections = [x for x in reader.connections if x.topic in topics]
+    message_count = sum(getattr(connection, "msgcount", 0) for connection in connections)
+    sampled = max(min(sample_size, message_count), 1)
+
+    small_sampled = max(sampled // 2, 1)
+
+    # The traced run goes first, which also warms up caches and imports before the timed runs
+    traced_folder = Path(work_folder) / "traced" / data["folder"]
+    small_folder = Path(work_folder) / "small" / data["folder"]
+    full_folder = Path(work_folder) / "full" / data["folder"]
+    extractor, _, peak = run_sample(reader, bag_files, data, traced_folder, sampled, trace_memory=True)
+    _, small_elapsed, _ = run_sample(reader, bag_files, data, small_folder, small_sampled)
+    _, elapsed, _ = run_sample(reader, bag_files, data, full_folder, sampled)
+    read_bytes = sum(
+        len(rawdata) for _, _, rawdata in itertools.islice(reader.messages(connections=connections), sampled)
+    )
+
+    scale = message_count / sampled
+    return EntryEstimate(
+        folder=data["folder"],
+        data_type=data["type"],
+        message_count=message_count,
+        sampled=sampled,
+        read_bytes=read_bytes * scale,
+        runtime=extrapolate(small_elapsed, elapsed, small_sampled, sampled, message_count),
+        output_bytes=extrapolate(folder_size(small_folder), folder_size(full_folder), small_sampled, sampled,
+                                 message_count),
+        peak_memory=peak if extractor.bounded_memory else peak * scale,
+    )
+
+
+def plan_extraction(bag_files, config, ignore_missing=False, sample_size=20):
+    """Predict runtime, output size and peak memory of each config entry without extracting the bag."""
+    bag_files = resolve_bag_files(bag_files)
+
+    with AnyReader(bag_files) as reader, tempfile.TemporaryDirectory() as work_folder:
+        check_requested_topics(reader, config, ignore_missing)
+        print(f"Bag duration: {format_duration(reader.duration / 1e9)}, "
+              f"{reader.message_count} messages in {len(reader.connections)} connections")
+
+        estimates = []
+        for i, data in enumerate(config):
+            if data["type"] not in EXTRACTORS:
+                raise ValueError(f"{Colors.FAIL}Unsupported data type: {data['type']}!{Colors.ENDC}")
+            print(f"Sampling {data['type']} data from topic {data['topic']}...", flush=True)
+            estimates.append(estimate_entry(reader, bag_files, data, Path(work_folder) / str(i), sample_size))
+
+    print_plan(estimates)
+    return estimates
+
+
+def print_plan(estimates):
+    total_runtime = sum(x.runtime for x in estimates)
+    header = f"{'folder':<24} {'type':<12} {'messages':>10} {'read':>10} {'runtime':>12} {'output':>10} {'memory':>10}"
+    print("-" * len(header))
+    print(header)
+    print("-" * len(header))
+
+    for estimate in estimates:
+        line = (f"{estimate.folder:<24} {estimate.data_type:<12} {estimate.message_count:>10d} "
+                f"{format_bytes(estimate.read_bytes):>10} {format_duration(estimate.runtime):>12} "
+                f"{format_bytes(estimate.output_bytes):>10} {format_bytes(estimate.peak_memory):>10}")
+        if len(estimates) > 1 and total_runtime > 0 and estimate.runtime / total_runtime > DOMINANT_SHARE:
+            line += f"  {Colors.WARNING}<- dominant ({estimate.runtime / total_runtime:.0%} of runtime){Colors.ENDC}"
+        print(line)
+
+    print("-" * len(header))
+    print(f"{'total':<24} {'':<12} {sum(x.message_count for x in estimates):>10d} "
+          f"{format_bytes(sum(x.read_bytes for x in estimates)):>10} {format_duration(total_runtime):>12} "
+          f"{format_bytes(sum(x.output_bytes for x in estimates)):>10} "
+          f"{format_bytes(max((x.peak_memory for x in estimates), default=0)):>10}")
+    print(f"Estimates extrapolated from {max((x.sampled for x in estimates), default=0)} sampled messages per entry "
+          f"(single process, entries run one after the other).")
@@ -24,12 +24,16 @@ typestore.register(get_types_from_msg(AUDIO_DATA_STAMPED_MSG, "audio_common_msgs
 
 class AudioExtractor(CSVExtractor):
     
-    def __init__(self, bag_file, topic_name, save_folder, args, overwrite=False):
-        super().__init__(bag_file, topic_name, save_folder, args, overwrite)
+    # WAV files are written at once, so audio received while following a bag is kept until the end
+    streamable = False
+    
+    def __init__(self, bag_files, topic_name, save_folder, args, overwrite=False):
+        super().__init__(bag_files, topic_name, save_folder, args, overwrite)
         self.data_type = "audio"
-        self.ext = args.get("extension", "wav")
-        self.sample_rate = args.get("sample_rate", 44100)
-        self.output_file = Path(save_folder) / (Path(save_folder).name + f".{self.ext}")
+        self.ext = self.args.get("extension", "wav")
+        self.sample_rate = self.args.get("sample_rate", 44100)
+        if save_folder is not None:
+            self.output_file = Path(save_folder) / (Path(save_folder).name + f".{self.ext}")
     
     def _process_message(self, msg, ros_time, msgtype):
         if msgtype.endswith("AudioData"):
@@ -39,6 +43,9 @@ class AudioExtractor(CSVExtractor):
         print(f"Warning: Unknown audio message type: {msgtype}")
         return None
     
+    def _make_batch(self, items):
+        return np.frombuffer(b''.join(items), dtype=np.int16)
+    
     def _save_data(self, data):
         audio_data = bytearray(b''.join(data))
         
@@ -0,0 +1,117 @@
+import shutil
+from tqdm import tqdm
+from rosbags.rosbag1 import Writer as Writer1
+from rosbags.rosbag2 import StoragePlugin, Writer as Writer2
+
+from src.base_extractor import BaseExtractor
+
+BAG_FORMATS = ["mcap", "sqlite3", "ros1"]
+# rosbag2 metadata version written, readable from ROS2 Humble
+ROS2_BAG_VERSION = 8
+
+
+class BagExtractor(BaseExtractor):
+
+    live = False
+    bounded_memory = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data_type = "bag"
+        self.topics = self.topic_name if isinstance(self.topic_name, list) else [self.topic_name]
+        self.format = self.args.get("format", None)
+        self.compression = self.args.get("compression", None)
+        self.start = self.args.get("start", None)
+        self.end = self.args.get("end", None)
+        self.output_path = None
+
+        if self.format is not None and self.format not in BAG_FORMATS:
+            raise ValueError(f"Unsupported bag format: {self.format} (expected one of {BAG_FORMATS})")
+
+    def extract(self, reader):
+        """Copy the raw serialized messages of the selected topics to a new bag, without deserializing them."""
+        self._resolve_format(reader)
+        if not self._check_overwrite():
+            return
+
+        connections = [x for x in reader.connections if x.topic in self.topics]
+        if not connections:
+            print(f"Warning: No messages found for topics {self.topics}")
+            return
+
+        start = reader.start_time + int(self.start * 1e9) if self.start is not None else None
+        stop = reader.start_time + int(self.end * 1e9) if self.end is not None else None
+        message_count = sum(getattr(connection, "msgcount", 0) for connection in connections)
+        self._log_start()
+
+        writer = self._open_writer()
+        with writer:
+            output_connections = {}
+            for connection in connections:
+                key = (connection.topic, connection.msgtype)
+                if key not in output_connections:
+                    output_connections[key] = self._add_connection(writer, reader, connection)
+
+            for connection, ros_time, rawdata in tqdm(reader.messages(connections=connections, start=start, stop=stop),
+                                                      total=message_count):
+                writer.write(output_connections[(connection.topic, connection.msgtype)], ros_time, rawdata)
+
+        self._log_complete()
+
+    def _resolve_format(self, reader):
+        """Default to mcap for ROS2 bags and ros1 for ROS1 bags, and reject conversions between versions."""
+        if self.format is None:
+            self.format = "mcap" if reader.is2 else "ros1"
+        if reader.is2 == (self.format == "ros1"):
+            version = "ROS2" if reader.is2 else "ROS1"
+            raise ValueError(f"Bag format {self.format} cannot be written from a {version} bag "
+                             f"(conversion between ROS1 and ROS2 is not supported)")
+
+        name = self.save_folder.name
+        self.output_path = self.save_folder / (f"{name}.bag" if self.format == "ros1" else name)
+
+    def _open_writer(self):
+        if self.format == "ros1":
+            writer = Writer1(self.output_path)
+            if self.compression:
+                writer.set_compression(Writer1.CompressionFormat[self.compression.upper()])
+            return writer
+
+        storage = StoragePlugin.MCAP if self.format == "mcap" else StoragePlugin.SQLITE3
+        writer = Writer2(self.output_path, version=ROS2_BAG_VERSION, storage_plugin=storage)
+        if self.compression:
+            writer.set_compression(Writer2.CompressionMode[self.compression.upper()], Writer2.CompressionFormat.ZSTD)
+        return writer
+
+    def _add_connection(self, writer, reader, connection):
+        ext = connection.ext
+        if self.format == "ros1":
+            kwargs = {"callerid": ext.callerid, "latching": ext.latching}
+        else:
+            kwargs = {"serialization_format": ext.serialization_format,
+                      "offered_qos_profiles": ext.offered_qos_profiles}
+        return writer.add_connection(connection.topic, connection.msgtype, typestore=reader.typestore, **kwargs)
+
+    def _check_overwrite(self):
+        if self.output_path.exists():
+            if not self.overwrite:
+                print(f"Output bag {self.output_path} already exists. Skipping...")
+                return False
+            if self.output_path.is_dir():
+                shutil.rmtree(self.output_path)
+            else:
+                self.output_path.unlink()
+        self.save_folder.mkdir(parents=True, exist_ok=True)
+        return True
+
+    def _process_message(self, msg, ros_time, msgtype):
+        return None
+
+    def _save_data(self, data):
+        pass
+
+    def _log_start(self):
+        print(f"Copying topics {self.topics} to {self.format} bag \"{self.output_path}\"")
+
+    def _log_complete(self):
+        print(f"Done! Exported {self.data_type} to {self.output_path}")
@@ -8,7 +8,7 @@ class BasicExtractor(CSVExtractor):
         super().__init__(*args, **kwargs)
         self.data_type = "basic"
     
-    def _pre_extract(self, reader):
+    def _prepare(self, reader):
         connections = [x for x in reader.connections if x.topic == self.topic_name]
         if connections:
             self.columns = self._init_columns(reader, connections)
@@ -33,7 +33,12 @@ class BasicExtractor(CSVExtractor):
         if not connections:
             return []
 
-        connection, _, rawdata = next(reader.messages(connections=connections))
+        # The topic may be registered without messages yet when following a bag being recorded
+        first = next(reader.messages(connections=connections), None)
+        if first is None:
+            return []
+
+        connection, _, rawdata = first
         msg = reader.deserialize(rawdata, connection.msgtype)
         msg_dict = self._class_to_dict(msg)
         
@@ -1,5 +1,11 @@
+import numpy as np
+import pandas as pd
+import yaml
+
 from src.base_extractor import CSVExtractor
-from src.utils import extract_timestamp
+from src.utils import enu_rotation, extract_timestamp, geodetic_to_enu, geodetic_to_utm, rotate_covariance, utm_zone
+
+COV_NAMES = ["cov_xx", "cov_xy", "cov_xz", "cov_yx", "cov_yy", "cov_yz", "cov_zx", "cov_zy", "cov_zz"]
 
 
 class GNSSExtractor(CSVExtractor):
@@ -7,6 +13,13 @@ class GNSSExtractor(CSVExtractor):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.data_type = "gnss"
+        self.enu = self.args.get("enu", False)
+        self.utm = self.args.get("utm", False)
+        self.origin = self.args.get("origin", None)
+        self.utm_zone = self.args.get("utm_zone", None)
+        
+        if self.origin is not None and len(self.origin) != 3:
+            raise ValueError("origin must be [latitude, longitude, altitude]")
     
     def _process_message(self, msg, ros_time, msgtype):
         result = {
@@ -17,8 +30,57 @@ class GNSSExtractor(CSVExtractor):
             "altitude": msg.altitude,
         }
         
-        cov_names = ["cov_xx", "cov_xy", "cov_xz", "cov_yx", "cov_yy", "cov_yz", "cov_zx", "cov_zy", "cov_zz"]
-        for i, name in enumerate(cov_names):
+        for i, name in enumerate(COV_NAMES):
             result[name] = msg.position_covariance[i]
         
         return result
+    
+    def _make_batch(self, items):
+        df = pd.DataFrame(items)
+        if df.empty or not (self.enu or self.utm):
+            return df
+        
+        lat, lon, alt = (df[key].to_numpy(dtype=np.float64) for key in ["latitude", "longitude", "altitude"])
+        if self.origin is None:
+            valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon) & np.isfinite(alt))
+            if len(valid) == 0:
+                return df
+            self.origin = [float(lat[valid[0]]), float(lon[valid[0]]), float(alt[valid[0]])]
+            print(f"Using first fix as origin: {self.origin}")
+        
+        # NavSatFix covariances are expressed in the ENU frame tangent at each fix
+        covariance = df[COV_NAMES].to_numpy(dtype=np.float64).reshape(-1, 3, 3)
+        
+        if self.enu:
+            enu = geodetic_to_enu(lat, lon, alt, self.origin)
+            df["east"], df["north"], df["up"] = enu[:, 0], enu[:, 1], enu[:, 2]
+            rotation = enu_rotation(self.origin[0], self.origin[1]) @ enu_rotation(lat, lon).transpose(0, 2, 1)
+            local_cov = rotate_covariance(covariance, rotation).reshape(-1, 9)
+            for i, name in enumerate(COV_NAMES):
+                df[f"enu_{name}"] = local_cov[:, i]
+        
+        if self.utm:
+            if self.utm_zone is None:
+                self.utm_zone = utm_zone(self.origin[1])
+            south = self.origin[0] < 0
+            easting, northing, convergence = geodetic_to_utm(lat, lon, self.utm_zone, south)
+            df["utm_easting"], df["utm_northing"], df["utm_zone"] = easting, northing, self.utm_zone
+            cos_c, sin_c = np.cos(convergence), np.sin(convergence)
+            rotation = np.zeros((len(df), 3, 3))
+            rotation[:, 0, 0], rotation[:, 0, 1] = cos_c, -sin_c
+            rotation[:, 1, 0], rotation[:, 1, 1] = sin_c, cos_c
+            rotation[:, 2, 2] = 1.0
+            grid_cov = rotate_covariance(covariance, rotation).reshape(-1, 9)
+            for i, name in enumerate(COV_NAMES):
+                df[f"utm_{name}"] = grid_cov[:, i]
+        
+        return df
+    
+    def _finalize_output(self):
+        if self.origin is not None and (self.enu or self.utm):
+            origin = {"latitude": self.origin[0], "longitude": self.origin[1], "altitude": self.origin[2]}
+            if self.utm:
+                origin["utm_zone"] = int(self.utm_zone)
+                origin["hemisphere"] = "south" if self.origin[0] < 0 else "north"
+            with open(self.output_file.with_name(self.output_file.stem + "_origin.yaml"), "w") as origin_file:
+                yaml.safe_dump(origin, origin_file)
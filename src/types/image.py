@@ -1,3 +1,5 @@
+import shutil
+import subprocess
 import cv2
 import numpy as np
 from dataclasses import dataclass
@@ -66,6 +68,23 @@ ENCODINGS = {
 }
 
 
+def normalize_extension(ext):
+    ext = ext.lower().lstrip(".")
+    return "jpg" if ext == "jpeg" else ext
+
+
+def compressed_extension(image_format):
+    """File extension of a CompressedImage format string (e.g. "bgr8; jpeg compressed bgr8" -> "jpg")."""
+    image_format = image_format.lower()
+    if "compresseddepth" in image_format:
+        return None
+    if "jpeg" in image_format or "jpg" in image_format:
+        return "jpg"
+    if "png" in image_format:
+        return "png"
+    return None
+
+
 class ImageExtractor(FolderExtractor):
     
     def __init__(self, *args, **kwargs):
@@ -78,19 +97,29 @@ class ImageExtractor(FolderExtractor):
         self.scale = self.args.get("scale", 1.0)
         self.gray_scale = self.args.get("gray_scale", False)
         self.video = self.args.get("video", False)
+        self.passthrough = self.args.get("passthrough", True)
+        self.parallel_safe = not self.video
         self._video_writer = None
+        self._needs_transform = self.debayer or self.rectify or self.scale != 1.0 or self.gray_scale \
+            or self.quality_factor < 1.0 or self.video
     
-    def _pre_extract(self, reader):
+    def _prepare(self, reader):
         self.calib = self._get_camera_info(reader)
+    
+    def _pre_extract(self, reader):
         self._save_camera_calibration(self.calib)
         if self.video:
+            self._video_file = self.save_folder / f"{self.save_folder.name}.mp4"
             self._video_fps = self._compute_fps(reader)
             print(f"Estimated FPS for topic {self.topic_name}: {self._video_fps:.2f}")
     
     def _process_message(self, msg, ros_time, msgtype):
-        np_image = self._image_to_numpy(msg)
-        encoding = getattr(msg, 'encoding', None)
-        np_image = self._apply_transformations(np_image, encoding)
+        if self._can_passthrough(msg):
+            output_file = self.save_folder / f"{int(extract_timestamp(msg)):d}.{self.ext}"
+            output_file.write_bytes(msg.data)
+            return True
+        
+        np_image = self._decode_image(msg)
         if self.video:
             self._write_video_frame(np_image)
         else:
@@ -98,11 +127,68 @@ class ImageExtractor(FolderExtractor):
             self._save_image(np_image, timestamp)
         return True
     
+    def _load_message(self, msg, ros_time, msgtype):
+        return {"timestamp": extract_timestamp(msg), "ros_time": ros_time, "image": self._decode_image(msg)}
+    
+    def _can_passthrough(self, msg):
+        """Compressed images are written as-is when no pixel transform is needed and the format matches."""
+        if not self.passthrough or self._needs_transform or not hasattr(msg, 'format'):
+            return False
+        return compressed_extension(msg.format) == normalize_extension(self.ext)
+    
+    def _decode_image(self, msg):
+        np_image = self._image_to_numpy(msg)
+        encoding = getattr(msg, 'encoding', None)
+        return self._apply_transformations(np_image, encoding)
+    
     def _post_extract(self, reader):
         if self._video_writer is not None:
             self._video_writer.release()
             print(f"Saved video to {self._video_file}")
     
+    def _prepare_shard(self, index):
+        if self.video:
+            self._video_file = self._shard_video_file(index)
+    
+    def _finish_shard(self, index):
+        if self._video_writer is not None:
+            self._video_writer.release()
+            self._video_writer = None
+    
+    def _merge_shards(self, shard_count):
+        if not self.video:
+            return
+        
+        segments = [self._shard_video_file(i) for i in range(shard_count)]
+        segments = [segment for segment in segments if segment.exists()]
+        if not segments:
+            return
+        
+        if shutil.which("ffmpeg"):
+            segment_list = self.save_folder / "segments.txt"
+            segment_list.write_text("".join(f"file '{segment.name}'\n" for segment in segments))
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", str(segment_list), "-c", "copy", str(self._video_file)], check=True)
+            segment_list.unlink()
+        else:
+            for segment in segments:
+                capture = cv2.VideoCapture(str(segment))
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    self._write_video_frame(frame)
+                capture.release()
+            self._video_writer.release()
+            self._video_writer = None
+        
+        for segment in segments:
+            segment.unlink()
+        print(f"Saved video to {self._video_file}")
+    
+    def _shard_video_file(self, index):
+        return self.save_folder / f"{self.save_folder.name}.part{index:03d}.mp4"
+    
     def _apply_transformations(self, image, encoding):
         if self.debayer and encoding and "bayer" in encoding:
             image = cv2.cvtColor(image, cv2.COLOR_BayerRG2RGB)
@@ -146,13 +232,15 @@ class ImageExtractor(FolderExtractor):
         topic_base = self.topic_name.replace("/compressed", "")
         camera_info_topic = "/".join(topic_base.split("/")[:-1] + ["camera_info"])
         connections = [x for x in reader.connections if x.topic == camera_info_topic]
+        # The topic may be registered without messages yet when following a bag being recorded
+        first = next(reader.messages(connections=connections), None) if connections else None
 
-        if not connections:
+        if first is None:
             if self.rectify:
-                raise ValueError(f"Camera info topic not found for {self.topic_name}")
+                raise ValueError(f"No camera info found for {self.topic_name}")
             return None
 
-        connection, _, rawdata = next(reader.messages(connections=connections))
+        connection, _, rawdata = first
         camera_info = reader.deserialize(rawdata, connection.msgtype)
         
         K = np.array(camera_info.k if hasattr(camera_info, 'k') else camera_info.K).reshape([3, 3])
@@ -200,7 +288,6 @@ class ImageExtractor(FolderExtractor):
         image = self._to_bgr(image)
         if self._video_writer is None:
             height, width = image.shape[:2]
-            self._video_file = self.save_folder / f"{self.save_folder.name}.mp4"
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')
             self._video_writer = cv2.VideoWriter(str(self._video_file), fourcc, self._video_fps, (width, height))
         self._video_writer.write(image)
@@ -17,23 +17,104 @@ DATA_TYPES = {
 
 
 class PointCloudExtractor(FolderExtractor):
-    
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.data_type = "point_clouds"
-    
+        self.fields = self.args.get("fields", None)
+        self.remove_nan = self.args.get("remove_nan", False)
+        self.min_range = self.args.get("min_range", None)
+        self.max_range = self.args.get("max_range", None)
+        self.crop_box = self.args.get("crop_box", None)
+        self.voxel_size = self.args.get("voxel_size", None)
+        self.random_ratio = self.args.get("random_ratio", 1.0)
+        self.seed = self.args.get("seed", None)
+
+        if not 0.0 < self.random_ratio <= 1.0:
+            raise ValueError("random_ratio must be in the interval (0, 1]")
+        if self.crop_box is not None and len(self.crop_box) != 6:
+            raise ValueError("crop_box must be [x_min, y_min, z_min, x_max, y_max, z_max]")
+
     def _process_message(self, msg, ros_time, msgtype):
         timestamp = extract_timestamp(msg)
-        df = pd.DataFrame()
-        data = np.frombuffer(msg.data, dtype=np.uint8).reshape(-1, msg.point_step)
-        
-        for field in msg.fields:
-            if field.datatype not in DATA_TYPES:
-                raise ValueError(f"Unknown point cloud field datatype: {field.datatype}")
-            dtype = DATA_TYPES[field.datatype]
-            n_bytes = np.dtype(dtype).itemsize
-            df[field.name] = data[:, field.offset : field.offset + n_bytes].flatten().view(dtype=dtype)
-        
+        points = self._decode_points(msg, ros_time)
+        df = pd.DataFrame({name: points[name] for name in points.dtype.names})
+
         output_file = self.save_folder / f"{int(timestamp):d}.csv"
         df.to_csv(output_file, index=False)
         return True
+
+    def _load_message(self, msg, ros_time, msgtype):
+        return {"timestamp": extract_timestamp(msg), "ros_time": ros_time, "points": self._decode_points(msg, ros_time)}
+
+    def _decode_points(self, msg, ros_time):
+        points = self._filter_points(self._cloud_to_numpy(msg), ros_time)
+        if not self.fields:
+            return points
+
+        unknown = set(self.fields) - set(points.dtype.names)
+        if unknown:
+            raise ValueError(f"Unknown point cloud fields requested: {sorted(unknown)}")
+        return points[self.fields]
+
+    def _cloud_to_numpy(self, msg):
+        names, formats, offsets = [], [], []
+        for field in msg.fields:
+            if field.datatype not in DATA_TYPES:
+                raise ValueError(f"Unknown point cloud field datatype: {field.datatype}")
+            names.append(field.name)
+            formats.append(DATA_TYPES[field.datatype])
+            offsets.append(field.offset)
+
+        dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": msg.point_step})
+        return np.frombuffer(msg.data, dtype=dtype, count=len(msg.data) // msg.point_step)
+
+    def _filter_points(self, points, ros_time):
+        needs_xyz = self.remove_nan or self.min_range is not None or self.max_range is not None \
+            or self.crop_box is not None or self.voxel_size
+        if not needs_xyz and self.random_ratio == 1.0:
+            return points
+
+        if needs_xyz:
+            missing = {"x", "y", "z"} - set(points.dtype.names)
+            if missing:
+                raise ValueError(f"Point cloud filtering requires fields x, y and z (missing {sorted(missing)})")
+
+        mask = np.ones(len(points), dtype=bool)
+        if needs_xyz:
+            xyz = np.stack([points["x"], points["y"], points["z"]], axis=1).astype(np.float64)
+
+        if self.remove_nan or self.voxel_size:
+            mask &= np.isfinite(xyz).all(axis=1)
+
+        if self.min_range is not None or self.max_range is not None:
+            squared_range = np.einsum("ij,ij->i", xyz, xyz)
+            if self.min_range is not None:
+                mask &= squared_range >= self.min_range ** 2
+            if self.max_range is not None:
+                mask &= squared_range <= self.max_range ** 2
+
+        if self.crop_box is not None:
+            box = np.asarray(self.crop_box, dtype=np.float64)
+            mask &= ((xyz >= box[:3]) & (xyz <= box[3:])).all(axis=1)
+
+        indices = np.flatnonzero(mask)
+
+        if self.voxel_size and len(indices) > 0:
+            voxels = np.floor(xyz[indices] / self.voxel_size).astype(np.int64)
+            voxels -= voxels.min(axis=0)
+            dims = voxels.max(axis=0) + 1
+            if np.prod(dims.astype(np.float64)) < 2 ** 63:
+                # A single int64 key per voxel makes the unique a fast 1-D sort
+                _, first = np.unique(np.ravel_multi_index(voxels.T, dims), return_index=True)
+            else:
+                _, first = np.unique(voxels, axis=0, return_index=True)
+            indices = indices[np.sort(first)]
+
+        if self.random_ratio < 1.0:
+            # One generator per message, so a seeded downsampling does not depend on the processing order
+            rng = np.random.default_rng(None if self.seed is None else [self.seed, ros_time])
+            n_keep = int(round(len(indices) * self.random_ratio))
+            indices = np.sort(rng.choice(indices, size=n_keep, replace=False))
+
+        return points[indices]
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+from src.base_extractor import CSVExtractor
+from src.utils import extract_timestamp
+
+SYNC_MODES = ["nearest", "previous", "linear"]
+QUATERNION_COLUMNS = ["qx", "qy", "qz", "qw"]
+EULER_COLUMNS = ["roll", "pitch", "yaw"]
+
+
+class SyncExtractor(CSVExtractor):
+
+    live = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data_type = "synchronized"
+        self.mode = self.args.get("mode", "nearest")
+        self.topics = self.args.get("topics", [])
+        max_gap = self.args.get("max_gap", None)
+        self.max_gap_ns = int(max_gap * 1e9) if max_gap is not None else None
+
+        if self.mode not in SYNC_MODES:
+            raise ValueError(f"Unsupported sync mode: {self.mode} (expected one of {SYNC_MODES})")
+        if not self.topics:
+            raise ValueError("topics must be specified in args")
+
+    def _prepare(self, reader):
+        from src.extractors import EXTRACTORS
+
+        bag_topics = {x.topic for x in reader.connections}
+        self.tables = []
+        for entry in self.topics:
+            topic, extractor_type = entry["topic"], entry["type"]
+            if topic not in bag_topics:
+                raise ValueError(f"Topic {topic} not found in bag file.")
+            if extractor_type not in EXTRACTORS:
+                raise ValueError(f"Unsupported data type: {extractor_type}!")
+
+            print(f"Loading {extractor_type} data from topic \"{topic}\" for synchronization")
+            extractor = EXTRACTORS[extractor_type](self.bag_files, topic, None, entry.get("args") or {})
+            batches = list(extractor.iter_batches(reader))
+            if batches and not all(isinstance(batch, pd.DataFrame) for batch in batches):
+                raise ValueError(f"Data type {extractor_type} cannot be synchronized (not a table)")
+
+            table = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=["timestamp"])
+            prefix = entry.get("prefix", topic.strip("/").replace("/", "_") + "_")
+            self.tables.append((prefix, table))
+
+    def _process_message(self, msg, ros_time, msgtype):
+        timestamp = extract_timestamp(msg)
+        return {"timestamp": timestamp if timestamp is not None else ros_time, "ros_time": ros_time}
+
+    def _make_batch(self, items):
+        reference = pd.DataFrame(items, columns=["timestamp", "ros_time"])
+        ref_ts = reference["timestamp"].to_numpy(dtype=np.int64)
+
+        aligned = [reference]
+        for prefix, table in self.tables:
+            aligned.append(align_table(ref_ts, table, self.mode, self.max_gap_ns).add_prefix(prefix))
+
+        return pd.concat(aligned, axis=1)
+
+
+def table_timestamps(table):
+    """Best available timestamp of each row: header stamp when present, else the bag time."""
+    if "timestamp" in table and "ros_time" in table:
+        return table["timestamp"].fillna(table["ros_time"]).to_numpy(dtype=np.int64)
+    column = "timestamp" if "timestamp" in table else "ros_time"
+    return table[column].to_numpy(dtype=np.int64)
+
+
+def align_table(ref_ts, table, mode="nearest", max_gap_ns=None):
+    """Align the rows of a table to reference timestamps with a vectorized sorted-array search.
+
+    Reference rows without a match (outside the table or farther than max_gap_ns) are left empty.
+    """
+    ts = table_timestamps(table)
+    order = np.argsort(ts, kind="stable")
+    ts, table = ts[order], table.iloc[order].reset_index(drop=True)
+    n = len(ts)
+
+    if n == 0:
+        return pd.DataFrame(index=range(len(ref_ts)), columns=table.columns)
+
+    if mode == "previous":
+        index = np.searchsorted(ts, ref_ts, side="right") - 1
+        valid = index >= 0
+        index = np.clip(index, 0, n - 1)
+        gap = ref_ts - ts[index]
+    elif mode == "nearest":
+        right = np.clip(np.searchsorted(ts, ref_ts, side="left"), 0, n - 1)
+        left = np.clip(right - 1, 0, n - 1)
+        use_left = np.abs(ref_ts - ts[left]) <= np.abs(ts[right] - ref_ts)
+        index = np.where(use_left, left, right)
+        valid = np.ones(len(ref_ts), dtype=bool)
+        gap = np.abs(ref_ts - ts[index])
+    else:
+        left = np.searchsorted(ts, ref_ts, side="right") - 1
+        right = np.minimum(left + 1, n - 1)
+        exact = (left >= 0) & (ts[np.clip(left, 0, n - 1)] == ref_ts)
+        valid = (left >= 0) & ((left + 1 < n) | exact)
+        left, right = np.clip(left, 0, n - 1), np.where(exact, left, right).clip(0, n - 1)
+        gap = np.maximum(ref_ts - ts[left], ts[right] - ref_ts)
+        index = left
+
+    if max_gap_ns is not None:
+        valid &= gap <= max_gap_ns
+
+    result = table.iloc[index].reset_index(drop=True)
+
+    if mode == "linear":
+        span = (ts[right] - ts[left]).astype(np.float64)
+        weight = np.divide((ref_ts - ts[left]).astype(np.float64), span, out=np.zeros(len(ref_ts)), where=span > 0)
+        upper = table.iloc[right].reset_index(drop=True)
+        has_quaternion = set(QUATERNION_COLUMNS) <= set(table.columns)
+        if has_quaternion:
+            low = result[QUATERNION_COLUMNS].to_numpy(dtype=np.float64)
+            high = upper[QUATERNION_COLUMNS].to_numpy(dtype=np.float64)
+            result[QUATERNION_COLUMNS] = slerp(low, high, weight)
+
+        for column in table.columns:
+            if pd.api.types.is_bool_dtype(table[column]) or not pd.api.types.is_numeric_dtype(table[column]):
+                continue
+            if has_quaternion and column in QUATERNION_COLUMNS:
+                continue
+            low, high = result[column].to_numpy(), upper[column].to_numpy()
+            if column in EULER_COLUMNS:
+                # Interpolate along the shortest arc, so angles wrapping around +-pi stay continuous
+                delta = np.angle(np.exp(1j * (high - low)))
+                result[column] = np.angle(np.exp(1j * (low + weight * delta)))
+            elif pd.api.types.is_integer_dtype(table[column]):
+                result[column] = low + np.round(weight * (high - low)).astype(np.int64)
+            else:
+                result[column] = low + weight * (high - low)
+
+    # Nullable types, so that unmatched rows can be left empty
+    for column in result.columns:
+        if pd.api.types.is_bool_dtype(result[column]):
+            result[column] = result[column].astype("boolean")
+        elif pd.api.types.is_integer_dtype(result[column]):
+            result[column] = result[column].astype("Int64")
+    result.loc[~valid, :] = np.nan
+    return result
+
+
+def slerp(low, high, weight):
+    """Spherical linear interpolation between two arrays of quaternions, along the shortest path."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        low = low / np.linalg.norm(low, axis=1, keepdims=True)
+        high = high / np.linalg.norm(high, axis=1, keepdims=True)
+    dot = np.einsum("ij,ij->i", low, high)
+    high = np.where((dot < 0)[:, None], -high, high)
+    dot = np.clip(np.abs(dot), 0.0, 1.0)
+
+    angle = np.arccos(dot)
+    sin_angle = np.sin(angle)
+    close = sin_angle < 1e-9
+    safe_sin = np.where(close, 1.0, sin_angle)
+    low_weight = np.where(close, 1.0 - weight, np.sin((1.0 - weight) * angle) / safe_sin)
+    high_weight = np.where(close, weight, np.sin(weight * angle) / safe_sin)
+
+    result = low_weight[:, None] * low + high_weight[:, None] * high
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return result / np.linalg.norm(result, axis=1, keepdims=True)
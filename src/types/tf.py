@@ -3,38 +3,68 @@ from scipy.spatial.transform import Rotation
 from tqdm import tqdm
 
 from src.base_extractor import FolderExtractor
-from src.utils import TFBuffer
+from src.utils import SampleBuffer, TFBuffer
 
 
 class TFExtractor(FolderExtractor):
     
+    parallel_safe = False
+    shardable = False
+    auxiliary_topics = ['/tf_static']
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.data_type = "TF transforms"
         
         self.base_frame = self.args.get('base_frame')
         self.target_frames = self.args.get('target_frames', [])
+        frame_pairs = self.args.get('frame_pairs', [])
+        for pair in frame_pairs:
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                raise ValueError(f"frame_pairs must be [base_frame, target_frame] pairs (got {pair})")
+        pairs = [(self.base_frame, target) for target in self.target_frames] if self.base_frame else []
+        self.frame_pairs = list(dict.fromkeys(pairs + [tuple(pair) for pair in frame_pairs]))
         
-        if not self.base_frame:
+        if self.target_frames and not self.base_frame:
             raise ValueError("base_frame must be specified in args")
-        if not self.target_frames:
-            raise ValueError("target_frames must be specified in args")
+        if not self.frame_pairs:
+            raise ValueError("target_frames or frame_pairs must be specified in args")
         
         self.euler = self.args.get('euler', False)
         self.sample_rate = self.args.get('sample_rate', None)
+        self.chunk_size = self.args.get('chunk_size', 10000)
     
-    def _pre_extract(self, reader):      
+    def _prepare(self, reader):
         self.tf_buffer = TFBuffer()
         self._load_static_transforms(reader)
         
-        self.frame_data = {target: [] for target in self.target_frames}
-        self.last_sample_time = {target: 0 for target in self.target_frames}
+        self.frame_data = {pair: SampleBuffer(len(self._columns()) - 1) for pair in self.frame_pairs}
+        self.written_rows = {pair: 0 for pair in self.frame_pairs}
+        self.last_sample_time = {pair: 0 for pair in self.frame_pairs}
         if self.sample_rate:
             self.sample_period_ns = int(1e9 / self.sample_rate)
     
     def _process_message(self, msg, ros_time, msgtype):
+        for pair, row in self._sample_transforms(msg):
+            buffer = self.frame_data[pair]
+            buffer.append(row[0], row[1:])
+            if len(buffer) >= self.chunk_size:
+                self._flush_frame(pair)
+        return None
+    
+    def _load_message(self, msg, ros_time, msgtype):
+        return [[*pair, *row] for pair, row in self._sample_transforms(msg)]
+    
+    def _process_auxiliary_message(self, msg, ros_time, msgtype):
+        self._set_static_transforms(msg)
+    
+    def _make_batch(self, items):
+        rows = [row for sample in items for row in sample]
+        return pd.DataFrame(rows, columns=['base_frame', 'target_frame', *self._columns()])
+    
+    def _sample_transforms(self, msg):
         if not msg.transforms:
-            return None
+            return []
         
         first_stamp = msg.transforms[0].header.stamp
         timestamp_ns = int(first_stamp.sec * 1e9 + first_stamp.nanosec)
@@ -44,36 +74,62 @@ class TFExtractor(FolderExtractor):
             self.tf_buffer.set_transform(tf.header.frame_id, tf.child_frame_id,
                                        [t.x, t.y, t.z], [r.x, r.y, r.z, r.w])
         
-        for target_frame in self.target_frames:
-            if self.sample_rate and timestamp_ns - self.last_sample_time[target_frame] < self.sample_period_ns:
+        due_pairs = []
+        for pair in self.frame_pairs:
+            if self.sample_rate and timestamp_ns - self.last_sample_time[pair] < self.sample_period_ns:
                 continue
             
-            self.last_sample_time[target_frame] = timestamp_ns
-            
-            try:
-                trans, rot = self.tf_buffer.lookup_transform(target_frame, self.base_frame)
-                if self.euler:
-                    rot = Rotation.from_quat(rot).as_euler('xyz', degrees=False)
-                self.frame_data[target_frame].append([timestamp_ns, *trans, *rot])
-            except Exception:
-                pass
+            self.last_sample_time[pair] = timestamp_ns
+            due_pairs.append(pair)
         
-        return None
+        transforms = self.tf_buffer.lookup_transforms([(target, base) for base, target in due_pairs])
+        
+        samples = []
+        for base_frame, target_frame in due_pairs:
+            transform = transforms[(target_frame, base_frame)]
+            if transform is None:
+                continue
+            trans, rot = transform
+            if self.euler:
+                rot = Rotation.from_quat(rot).as_euler('xyz', degrees=False)
+            samples.append(((base_frame, target_frame), [timestamp_ns, *trans, *rot]))
+        
+        return samples
+    
+    def _columns(self):
+        return ['timestamp', 'x', 'y', 'z', 'roll', 'pitch', 'yaw'] if self.euler else \
+               ['timestamp', 'x', 'y', 'z', 'qx', 'qy', 'qz', 'qw']
+    
+    def _append_data(self, data):
+        self._flush_frames()
     
     def _save_data(self, data):
-        safe_base = self.base_frame.replace('/', '_').lower()
-        columns = ['timestamp', 'x', 'y', 'z', 'roll', 'pitch', 'yaw'] if self.euler else \
-                  ['timestamp', 'x', 'y', 'z', 'qx', 'qy', 'qz', 'qw']
+        self._flush_frames()
+        for base_frame, target_frame in self.frame_pairs:
+            if not self.written_rows[(base_frame, target_frame)]:
+                print(f"No transforms found for target frame '{target_frame}' relative to base frame '{base_frame}'.")
+    
+    def _flush_frames(self):
+        for pair in self.frame_pairs:
+            self._flush_frame(pair)
+    
+    def _flush_frame(self, pair):
+        buffer = self.frame_data[pair]
+        if not len(buffer):
+            return
         
-        for target_frame in self.target_frames:
-            transform_data = self.frame_data[target_frame]
-            if transform_data:
-                safe_target = target_frame.replace('/', '_').lower()
-                output_file = self.save_folder / f"{safe_base}_to_{safe_target}.csv"
-                df = pd.DataFrame(transform_data, columns=columns)
-                df.to_csv(output_file, index=False)
-            else:
-                print(f"No transforms found for target frame '{target_frame}' relative to base frame '{self.base_frame}'.")
+        base_frame, target_frame = pair
+        safe_base = base_frame.replace('/', '_').lower()
+        safe_target = target_frame.replace('/', '_').lower()
+        output_file = self.save_folder / f"{safe_base}_to_{safe_target}.csv"
+        columns = self._columns()
+        
+        df = pd.DataFrame(buffer.values[:len(buffer)], columns=columns[1:])
+        df.insert(0, columns[0], buffer.timestamps[:len(buffer)])
+        written = self.written_rows[pair]
+        df.to_csv(output_file, mode="a" if written else "w", header=not written, index=False)
+        self.written_rows[pair] += len(buffer)
+        buffer.clear()
     
     def _load_static_transforms(self, reader):
         print("Reading static transforms...", end="", flush=True)
@@ -84,12 +140,14 @@ class TFExtractor(FolderExtractor):
             return
         
         for connection, ros_time, rawdata in reader.messages(connections=static_connections):
-            msg = reader.deserialize(rawdata, connection.msgtype)
-            for transform in msg.transforms:
-                t = transform.transform
-                self.tf_buffer.set_transform(
-                    transform.header.frame_id, transform.child_frame_id,
-                    [t.translation.x, t.translation.y, t.translation.z],
-                    [t.rotation.x, t.rotation.y, t.rotation.z, t.rotation.w])
+            self._set_static_transforms(reader.deserialize(rawdata, connection.msgtype))
         
         print(f" Done ({len(self.tf_buffer.transforms)} transforms)")
+    
+    def _set_static_transforms(self, msg):
+        for transform in msg.transforms:
+            t = transform.transform
+            self.tf_buffer.set_transform(
+                transform.header.frame_id, transform.child_frame_id,
+                [t.translation.x, t.translation.y, t.translation.z],
+                [t.rotation.x, t.rotation.y, t.rotation.z, t.rotation.w])
@@ -1,6 +1,5 @@
 """Utility functions used across multiple rosbag extraction modules."""
 
-from collections import deque
 import numpy as np
 from scipy.spatial.transform import Rotation
 
@@ -73,13 +72,120 @@ def extract_twist(twist_msg, prefix="vel_"):
     return result
 
 
+class SampleBuffer:
+    """Timestamped rows of floats in preallocated NumPy arrays, growing geometrically when full."""
+    
+    def __init__(self, width, capacity=1024):
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, width), dtype=np.float64)
+        self.size = 0
+    
+    def __len__(self):
+        return self.size
+    
+    def append(self, timestamp, values):
+        if self.size == len(self.timestamps):
+            self._grow(2 * len(self.timestamps))
+        self.timestamps[self.size] = timestamp
+        self.values[self.size] = values
+        self.size += 1
+    
+    def clear(self):
+        self.size = 0
+    
+    def _grow(self, capacity):
+        timestamps = np.empty(capacity, dtype=np.int64)
+        values = np.empty((capacity, self.values.shape[1]), dtype=np.float64)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        values[:self.size] = self.values[:self.size]
+        self.timestamps, self.values = timestamps, values
+
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+UTM_K0 = 0.9996
+
+
+def geodetic_to_ecef(lat, lon, alt):
+    """Convert arrays of WGS84 latitude/longitude (degrees) and altitude (m) to ECEF coordinates."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    sin_lat = np.sin(lat)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat ** 2)
+    x = (n + alt) * np.cos(lat) * np.cos(lon)
+    y = (n + alt) * np.cos(lat) * np.sin(lon)
+    z = (n * (1 - WGS84_E2) + alt) * sin_lat
+    return np.stack([x, y, z], axis=-1)
+
+
+def enu_rotation(lat, lon):
+    """Rotation matrices from ECEF to the local ENU frame at the given latitudes/longitudes (degrees)."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    sin_lon, cos_lon = np.sin(lon), np.cos(lon)
+    zero = np.zeros_like(lat)
+    return np.stack([
+        np.stack([-sin_lon, cos_lon, zero], axis=-1),
+        np.stack([-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat], axis=-1),
+        np.stack([cos_lat * cos_lon, cos_lat * sin_lon, sin_lat], axis=-1),
+    ], axis=-2)
+
+
+def geodetic_to_enu(lat, lon, alt, origin):
+    """Convert arrays of WGS84 coordinates to ENU coordinates relative to origin (lat, lon, alt)."""
+    ecef = geodetic_to_ecef(lat, lon, alt)
+    ecef_origin = geodetic_to_ecef(*origin)
+    return (ecef - ecef_origin) @ enu_rotation(origin[0], origin[1]).T
+
+
+def utm_zone(lon):
+    return int((lon + 180) // 6) % 60 + 1
+
+
+def geodetic_to_utm(lat, lon, zone, south=False):
+    """Convert arrays of WGS84 coordinates (degrees) to UTM easting/northing in the given zone.
+    
+    Uses the Krüger series (accurate to the millimeter within the zone). Also returns the
+    meridian convergence (radians, angle from true north to grid north, clockwise).
+    """
+    n = WGS84_F / (2 - WGS84_F)
+    big_a = WGS84_A / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = [n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16, 13 * n ** 2 / 48 - 3 * n ** 3 / 5, 61 * n ** 3 / 240]
+    
+    lat = np.radians(lat)
+    dlon = np.radians(lon) - np.radians((zone - 1) * 6 - 180 + 3)
+    c = 2 * np.sqrt(n) / (1 + n)
+    t = np.sinh(np.arctanh(np.sin(lat)) - c * np.arctanh(c * np.sin(lat)))
+    xi = np.arctan2(t, np.cos(dlon))
+    eta = np.arctanh(np.sin(dlon) / np.sqrt(1 + t ** 2))
+    
+    easting, northing = eta.copy(), xi.copy()
+    sigma, tau = np.ones_like(xi), np.zeros_like(xi)
+    for j, a_j in enumerate(alpha, start=1):
+        easting += a_j * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        northing += a_j * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        sigma += 2 * j * a_j * np.cos(2 * j * xi) * np.cosh(2 * j * eta)
+        tau += 2 * j * a_j * np.sin(2 * j * xi) * np.sinh(2 * j * eta)
+    
+    easting = 500000.0 + UTM_K0 * big_a * easting
+    northing = (10000000.0 if south else 0.0) + UTM_K0 * big_a * northing
+    tan_product = np.tan(xi) * np.tanh(eta)
+    convergence = np.arctan((tau + sigma * tan_product) / (sigma - tau * tan_product))
+    return easting, northing, convergence
+
+
+def rotate_covariance(covariance, rotation):
+    """Rotate a batch of 3x3 covariance matrices: R @ C @ R.T for each pair."""
+    return np.einsum("nij,njk,nlk->nil", rotation, covariance, rotation)
+
+
 class TFBuffer:
     """Transform buffer for TF tree management without ROS2 dependencies."""
     
     def __init__(self):
         self.transforms = {}  # {(parent, child): 4x4 matrix}
-        self._path_cache = {}  # {(source, target): path}
-        self._known_edges = set()
+        self._parents = {}  # {child: parent}
+        self._reparented = set()  # {(child, parent)} already warned about
         
     def set_transform(self, parent_frame, child_frame, translation, rotation):
         """Add or update a transform."""
@@ -88,55 +194,52 @@ class TFBuffer:
         T[:3, :3] = Rotation.from_quat(rotation).as_matrix()
         T[:3, 3] = translation
         self.transforms[(parent_frame, child_frame)] = T
-        if (parent_frame, child_frame) not in self._known_edges:
-            self._known_edges.add((parent_frame, child_frame))
-            self._path_cache.clear()
-        
-    def lookup_transform(self, target_frame, source_frame):
-        """Look up transform from source_frame to target_frame."""
-        if target_frame == source_frame:
-            return np.array([0., 0., 0.]), np.array([0., 0., 0., 1.])
-        
-        cache_key = (source_frame, target_frame)
-        if cache_key not in self._path_cache:
-            self._path_cache[cache_key] = self._find_path(target_frame, source_frame)
-            
-        if self._path_cache[cache_key] is None:
-            raise ValueError(f"Cannot find transform from {source_frame} to {target_frame}")
-            
-        return self._compose_path(self._path_cache[cache_key])
-        
-    def _find_path(self, target_frame, source_frame):
-        """BFS to find path from source to target frame."""
-        queue = deque([(source_frame, [])])
-        visited = {source_frame}
+        previous = self._parents.get(child_frame)
+        if previous is not None and previous != parent_frame and (child_frame, parent_frame) not in self._reparented:
+            self._reparented.add((child_frame, parent_frame))
+            print(f"{Colors.WARNING}Warning: Parent of frame {child_frame} changed from {previous} to "
+                  f"{parent_frame}, using the latest one{Colors.ENDC}")
+        self._parents[child_frame] = parent_frame
         
-        while queue:
-            current, path = queue.popleft()
-            if current == target_frame:
-                return path
-                
-            for parent, child in self.transforms:
-                if parent == current and child not in visited:
-                    visited.add(child)
-                    queue.append((child, path + [(parent, child, False)]))
-                elif child == current and parent not in visited:
-                    visited.add(parent)
-                    queue.append((parent, path + [(parent, child, True)]))
-        return None
+    def lookup_transforms(self, frame_pairs):
+        """Look up transforms for several (target_frame, source_frame) pairs at once.
         
-    def _compose_path(self, path):
-        """Compose transforms along a path."""
-        result = np.eye(4)
-        
-        for parent, child, inverse in path:
-            T = self.transforms.get((parent, child))
-            if T is None:
-                raise KeyError(f"Transform {parent}->{child} not available")
+        The chain from each frame to the root of its tree is composed once and shared by all the
+        pairs going through it. Pairs without a transform map to None.
+        """
+        root_transforms = {}
+        results = {}
+        for target_frame, source_frame in frame_pairs:
+            try:
+                target_root, T_target = self._root_transform(target_frame, root_transforms)
+                source_root, T_source = self._root_transform(source_frame, root_transforms)
+            except KeyError:
+                results[(target_frame, source_frame)] = None
+                continue
+            if target_root != source_root:
+                results[(target_frame, source_frame)] = None
+                continue
             
-            result = result @ (np.linalg.inv(T) if inverse else T)
+            result = np.linalg.inv(T_source) @ T_target
+            results[(target_frame, source_frame)] = (result[:3, 3], Rotation.from_matrix(result[:3, :3]).as_quat())
+        return results
+    
+    def _root_transform(self, frame, root_transforms):
+        """Transform from the root of the frame's tree to the frame, memoized in root_transforms."""
+        chain = []
+        current = frame
+        while current not in root_transforms:
+            parent = self._parents.get(current)
+            if parent is None:
+                root_transforms[current] = (current, np.eye(4))
+                break
+            if len(chain) > len(self._parents):
+                raise KeyError(f"Loop in transform tree at frame {frame}")
+            chain.append(current)
+            current = parent
         
-        # Extract translation and rotation
-        trans = result[:3, 3]
-        rot = Rotation.from_matrix(result[:3, :3]).as_quat()
-        return trans, rot
+        root, T = root_transforms[current]
+        for child in reversed(chain):
+            T = T @ self.transforms[(self._parents[child], child)]
+            root_transforms[child] = (root, T)
+        return root_transforms[frame]